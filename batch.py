@@ -0,0 +1,229 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from metamingle import add_exif_watermark, DEFAULT_WORKERS
+from raw_api import RAW_EXTENSIONS
+
+QUEUED = "Queued"
+RUNNING = "Running"
+DONE = "Done"
+FAILED = "Failed"
+CANCELLED = "Cancelled"
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png') + RAW_EXTENSIONS
+
+
+def list_images(folder):
+	"""Return the supported images directly inside a folder, sorted by name."""
+	return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+				  if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+
+
+def batch_output_path(path, output_dir):
+	"""Output path used for batch renders: `<output_dir>/<name>_IG.jpg`."""
+	name = os.path.splitext(os.path.basename(path))[0] + "_IG.jpg"
+	return os.path.join(output_dir, name)
+
+
+def _output_key(path):
+	# Compared case-insensitively, since shared storage is often case-insensitive
+	return os.path.abspath(path).lower()
+
+
+def assign_output_paths(paths, output_dir, taken=()):
+	"""
+	Give every input its own output path in output_dir.
+
+	Inputs that share a name stem (RAW+JPEG pairs, identically numbered files
+	from two cards) keep their source extension in the name, e.g.
+	`img1_arw_IG.jpg` and `img1_jpg_IG.jpg`; any remaining clash, with each
+	other or with `taken`, gets a counter.
+
+	Args:
+		paths (list): Input images
+		output_dir (str): Output folder
+		taken (iterable): Output paths already in use
+
+	Returns:
+		list: Output paths, in the order of paths
+	"""
+	taken = {_output_key(path) for path in taken}
+	stems = Counter(os.path.splitext(os.path.basename(path))[0].lower() for path in paths)
+
+	outputs = []
+	for path in paths:
+		stem, ext = os.path.splitext(os.path.basename(path))
+		output = batch_output_path(path, output_dir)
+		if stems[stem.lower()] > 1 or _output_key(output) in taken:
+			base = f"{stem}_{ext.lstrip('.').lower()}"
+			output = os.path.join(output_dir, f"{base}_IG.jpg")
+			counter = 2
+			while _output_key(output) in taken:
+				output = os.path.join(output_dir, f"{base}_{counter}_IG.jpg")
+				counter += 1
+		taken.add(_output_key(output))
+		outputs.append(output)
+	return outputs
+
+
+class BatchRunner:
+	"""
+	Run add_exif_watermark over many files on a bounded pool of worker threads.
+
+	Workers never touch the caller's state or any UI: they post status events to
+	an internal queue, and the owner applies them by calling poll() from its own
+	thread (the GUI does this from a `root.after` loop).
+	"""
+
+	def __init__(self, output_dir, options=None, max_workers=DEFAULT_WORKERS):
+		self.output_dir = output_dir
+		self.options = options or {}
+		self.max_workers = max_workers
+		self.items = []
+
+		self._events = queue.Queue()
+		self._cancel_event = threading.Event()
+		self._executor = None
+		self._futures = {}
+		self._started_at = None
+		self._finished_at = None
+		self._completed = 0
+
+	def add(self, paths):
+		"""
+		Append paths to the queue, returning the indices of the new items.
+		Output names are assigned here, so no two items ever write the same file.
+		"""
+		start = len(self.items)
+		outputs = assign_output_paths(paths, self.output_dir, [item["output_path"] for item in self.items])
+		for path, output in zip(paths, outputs):
+			self.items.append({"path": path, "output_path": output, "status": QUEUED, "detail": "", "seconds": 0.0})
+		return list(range(start, len(self.items)))
+
+	@property
+	def running(self):
+		return any(not future.done() for future in self._futures.values())
+
+	@property
+	def active(self):
+		"""True until poll() has applied every event of the current run."""
+		return self._executor is not None
+
+	def start(self, indices=None):
+		"""
+		Submit the given items to the worker pool. By default every item that is
+		not done yet (queued, cancelled or failed) is submitted, so starting
+		again resumes a run instead of rendering finished items twice.
+		"""
+		if indices is None:
+			indices = [i for i, item in enumerate(self.items) if item["status"] in (QUEUED, CANCELLED, FAILED)]
+		if not indices:
+			return
+		os.makedirs(self.output_dir, exist_ok=True)
+
+		if not self.running:
+			if self._executor is not None:
+				self._executor.shutdown(wait=False)
+				self._executor = None
+			self._futures = {}
+			self._started_at = time.perf_counter()
+			self._finished_at = None
+			self._completed = 0
+		if self._executor is None or self._cancel_event.is_set():
+			# A cancelled pool is shut down; items still running on it finish
+			# on their own and stay tracked in self._futures
+			self._cancel_event.clear()
+			self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+		for index in indices:
+			if index in self._futures and not self._futures[index].done():
+				continue
+			item = self.items[index]
+			item.update(status=QUEUED, detail="", seconds=0.0)
+			self._futures[index] = self._executor.submit(self._run, index, item["path"], item["output_path"])
+
+	def retry_failed(self):
+		"""Re-queue every failed item."""
+		self.start([i for i, item in enumerate(self.items) if item["status"] == FAILED])
+
+	def cancel(self):
+		"""
+		Drop items that have not started yet and shut the worker pool down;
+		running items are allowed to finish. Without this, the pool's threads
+		would keep rendering the rest of the queue until the interpreter exits.
+		"""
+		self._cancel_event.set()
+		for index, future in self._futures.items():
+			if future.cancel():
+				self.items[index].update(status=CANCELLED, detail="")
+		if self._executor is not None:
+			self._executor.shutdown(wait=False, cancel_futures=True)
+
+	def _run(self, index, path, output_path):
+		if self._cancel_event.is_set():
+			self._events.put((index, CANCELLED, "", 0.0))
+			return
+
+		self._events.put((index, RUNNING, "", 0.0))
+		start = time.perf_counter()
+		try:
+			output = add_exif_watermark(path, output_path=output_path, **self.options)
+			self._events.put((index, DONE, output, time.perf_counter() - start))
+		except Exception as e:
+			self._events.put((index, FAILED, str(e), time.perf_counter() - start))
+
+	def poll(self):
+		"""
+		Apply pending worker events to self.items. Must be called from the owner's thread.
+
+		Returns:
+			list: Indices of items whose status changed
+		"""
+		changed = []
+		while True:
+			try:
+				index, status, detail, seconds = self._events.get_nowait()
+			except queue.Empty:
+				break
+			self.items[index].update(status=status, detail=detail, seconds=seconds)
+			if status in (DONE, FAILED):
+				self._completed += 1
+			changed.append(index)
+
+		if self._executor is not None and not self.running and self._events.empty():
+			self._executor.shutdown(wait=False)
+			self._executor = None
+			self._futures = {}
+			self._finished_at = time.perf_counter()
+		return changed
+
+	def stats(self):
+		"""
+		Summarize progress of the current run.
+
+		Returns:
+			dict: Counts per status, elapsed seconds, throughput (images/s) and ETA in seconds
+		"""
+		counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+		for item in self.items:
+			counts[item["status"]] += 1
+
+		if self._started_at is None:
+			elapsed = 0.0
+		else:
+			elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+
+		throughput = self._completed / elapsed if elapsed > 0 else 0.0
+		remaining = counts[QUEUED] + counts[RUNNING]
+		eta = remaining / throughput if throughput > 0 else None
+
+		return {
+			"counts": counts,
+			"total": len(self.items),
+			"elapsed": elapsed,
+			"throughput": throughput,
+			"eta": eta,
+		}
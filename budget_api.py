@@ -0,0 +1,154 @@
+import io
+import math
+import os
+from PIL import Image
+
+# Formats whose size can be traded against quality
+BUDGET_FORMATS = ('JPEG', 'WEBP')
+MIN_QUALITY = 5
+MAX_QUALITY = 95
+
+# The size/quality curve is sampled on a downsampled proxy of at most this
+# many pixels; full encodes then only correct and confirm the estimate
+PROXY_PIXELS = 500_000
+PROXY_QUALITIES = (5, 20, 40, 60, 75, 85, 95)
+# Bisecting the 92 possible outcomes (MIN_QUALITY..MAX_QUALITY, or none fits)
+# takes 7 encodes; the rest are spent on guesses from the proxy curve
+MAX_FULL_ENCODES = 8
+
+
+def _encode(img, image_format, quality):
+	buffer = io.BytesIO()
+	img.save(buffer, image_format, quality=quality)
+	return buffer.getvalue()
+
+
+def _proxy_curve(img, image_format):
+	"""Estimate full-size byte counts per quality from trial encodes of a downsampled proxy."""
+	pixels = img.width * img.height
+	scale = min(1.0, math.sqrt(PROXY_PIXELS / pixels))
+	proxy = img
+	if scale < 1.0:
+		proxy = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.BILINEAR)
+
+	pixel_ratio = pixels / (proxy.width * proxy.height)
+	return [(quality, len(_encode(proxy, image_format, quality)) * pixel_ratio) for quality in PROXY_QUALITIES]
+
+
+def _interpolate(points, quality):
+	"""Interpolate (quality, value) points linearly in log-value, clamping at both ends."""
+	if quality <= points[0][0]:
+		return points[0][1]
+	for (q0, v0), (q1, v1) in zip(points, points[1:]):
+		if quality <= q1:
+			t = (quality - q0) / (q1 - q0)
+			return math.exp(math.log(v0) + t * (math.log(v1) - math.log(v0)))
+	return points[-1][1]
+
+
+def _predict_quality(curve, anchors, max_bytes, low, high):
+	"""
+	Highest quality in [low, high] whose estimated size fits the budget (low if none does).
+	The proxy curve is rescaled by the full/proxy size ratios at the anchor
+	qualities, interpolated between them.
+	"""
+	for quality in range(high, low - 1, -1):
+		ratio = _interpolate(anchors, quality) if anchors else 1.0
+		if _interpolate(curve, quality) * ratio <= max_bytes:
+			return quality
+	return low
+
+
+def _secant_quality(point_a, point_b, max_bytes):
+	"""Quality where the line through two measured (quality, size) points, in log-size, meets the budget."""
+	(q0, s0), (q1, s1) = point_a, point_b
+	if s0 == s1:
+		return (q0 + q1) / 2
+	return q0 + (math.log(max_bytes) - math.log(s0)) * (q1 - q0) / (math.log(s1) - math.log(s0))
+
+
+def _bisections(outcomes):
+	"""Encodes needed to narrow `outcomes` possible answers down to one by bisection."""
+	return math.ceil(math.log2(outcomes)) if outcomes > 1 else 0
+
+
+def save_within_budget(img, output_path, max_bytes):
+	"""
+	Save an image as JPEG or WebP at the highest quality that fits in max_bytes.
+
+	The size/quality curve is estimated from trial encodes of a downsampled
+	proxy. Each full encode then corrects the estimate and narrows the range
+	between the highest quality known to fit and the lowest known not to.
+	Guesses from the curve are only made while enough encodes remain to finish
+	by bisection, so the range always closes: at most MAX_FULL_ENCODES
+	full-resolution encodes are made, and the quality returned is the highest
+	that fits as long as the encoded size grows with quality.
+
+	Args:
+		img (PIL.Image.Image): Image to save
+		output_path (str): Destination; the format follows its extension
+		max_bytes (int): Maximum file size in bytes
+
+	Returns:
+		int: The quality used
+
+	Raises:
+		ValueError: If max_bytes is not positive, the format is not JPEG/WebP or
+			the image does not fit even at MIN_QUALITY
+	"""
+	if max_bytes <= 0:
+		raise ValueError(f"max_bytes must be a positive number of bytes, got {max_bytes}")
+
+	extension = os.path.splitext(output_path)[1].lower()
+	image_format = Image.registered_extensions().get(extension)
+	if image_format not in BUDGET_FORMATS:
+		raise ValueError(f"max_bytes requires a JPEG or WebP output, got '{extension}'")
+
+	curve = _proxy_curve(img, image_format)
+
+	# fits / too_big: highest quality known to fit and lowest known not to; the
+	# answer is fits or a quality between them (fits below MIN_QUALITY: none fits)
+	fits, too_big = MIN_QUALITY - 1, MAX_QUALITY + 1
+	measured = {}
+	sides = []
+	best = None
+	while too_big - fits > 1:
+		low, high = fits + 1, too_big - 1
+
+		if MAX_FULL_ENCODES - len(measured) <= _bisections(too_big - fits) \
+				or sides[-2:] in (["fits", "fits"], ["too_big", "too_big"]):
+			# Out of spare encodes, or the same end moved twice: bisect so the
+			# range is sure to close
+			quality = (fits + too_big + 1) // 2
+		elif fits in measured and too_big in measured:
+			# Proxy curve pinned to the measured sizes at both range ends
+			anchors = [(q, measured[q] / _interpolate(curve, q)) for q in (fits, too_big)]
+			quality = _predict_quality(curve, anchors, max_bytes, low, high)
+		elif len(measured) >= 2:
+			# Still on one side: secant through the two latest measurements
+			points = list(measured.items())[-2:]
+			quality = int(_secant_quality(points[0], points[1], max_bytes))
+		elif measured:
+			# Rescale the proxy curve to the one full-size measurement
+			(q, size), = measured.items()
+			quality = _predict_quality(curve, [(q, size / _interpolate(curve, q))], max_bytes, low, high)
+		else:
+			# First guess straight from the proxy curve
+			quality = _predict_quality(curve, [], max_bytes, low, high)
+		quality = min(max(quality, low), high)
+
+		data = _encode(img, image_format, quality)
+		measured[quality] = len(data)
+		if len(data) <= max_bytes:
+			fits, best = quality, data
+			sides.append("fits")
+		else:
+			too_big = quality
+			sides.append("too_big")
+
+	if best is None:
+		raise ValueError(f"Cannot fit {os.path.basename(output_path)} within {max_bytes} bytes")
+
+	with open(output_path, 'wb') as fp:
+		fp.write(best)
+	return fits
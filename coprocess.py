@@ -0,0 +1,174 @@
+"""
+Persistent JSON-lines worker for pipeline integration.
+
+Reads one JSON request per line on stdin and writes one JSON result per line
+on stdout, so ingest tools can keep a single process running instead of paying
+interpreter, Pillow, font and logo start-up for every photo. Requests run
+concurrently on a thread pool; fonts and resized logos stay cached between them.
+
+Requests:
+	{"id": 1, "op": "render", "image_path": "a.jpg", "output_path": "a_IG.jpg", "options": {"template_style": "classic"}}
+	{"id": 2, "op": "exif", "image_path": "a.jpg"}
+
+Results echo the request id:
+	{"id": 1, "op": "render", "ok": true, "path": "a_IG.jpg", "error": null, "timings": {"queued": 0.0, "run": 0.21, "total": 0.21}}
+	{"id": 2, "op": "exif", "ok": true, "path": "a.jpg", "exif": {...}, "warning": null, "error": null, "timings": {...}}
+
+Results are written as they complete, or in request order with --ordered.
+Anything the renderer prints goes to stderr, keeping stdout pure JSON lines.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from exif_api import get_exif_info
+from metamingle import add_exif_watermark, DEFAULT_WORKERS
+from raw_api import is_raw_file, get_raw_exif
+
+# Requests accepted ahead of the workers before stdin reading pauses
+QUEUE_FACTOR = 4
+
+
+def _render(request):
+	options = dict(request.get("options") or {})
+	if options.get("text_color") is not None:
+		options["text_color"] = tuple(options["text_color"])
+	output = add_exif_watermark(request["image_path"], output_path=request.get("output_path"), **options)
+	return {"path": output}
+
+
+def _exif(request):
+	image_path = request["image_path"]
+	# Only a file that cannot be opened fails the request; get_exif_info keeps
+	# the fields it extracted before a parse error, which becomes a warning
+	if is_raw_file(image_path):
+		get_raw_exif(image_path)
+	else:
+		Image.open(image_path).close()
+	info = get_exif_info(image_path)
+	warning = info.pop("error", None)
+	return {"path": image_path, "exif": info, "warning": warning}
+
+
+OPERATIONS = {
+	"render": _render,
+	"exif": _exif,
+}
+
+
+def handle_request(request, received_at):
+	"""
+	Run one request and build its result line.
+
+	Args:
+		request (dict): Parsed request
+		received_at (float): perf_counter() value when the request was read
+
+	Returns:
+		dict: Result with id, op, ok, path, error and timings (seconds)
+	"""
+	started_at = time.perf_counter()
+	result = {"id": request.get("id"), "op": request.get("op"), "ok": True,
+			  "path": request.get("image_path"), "error": None}
+	try:
+		operation = OPERATIONS.get(request.get("op"))
+		if operation is None:
+			raise ValueError(f"unknown op {request.get('op')!r}, expected one of {sorted(OPERATIONS)}")
+		result.update(operation(request))
+	except Exception as e:
+		result["ok"] = False
+		result["error"] = str(e)
+
+	finished_at = time.perf_counter()
+	result["timings"] = {
+		"queued": started_at - received_at,
+		"run": finished_at - started_at,
+		"total": finished_at - received_at,
+	}
+	return result
+
+
+class ResultWriter:
+	"""
+	Write result lines to a stream, optionally holding them back to keep request order.
+	Each written line releases one slot of the optional semaphore, so results
+	held back for ordering still count against the reader's back-pressure.
+	"""
+
+	def __init__(self, stream, ordered=False, slots=None):
+		self.stream = stream
+		self.ordered = ordered
+		self.slots = slots
+		self._lock = threading.Lock()
+		self._pending = {}
+		self._next = 0
+
+	def write(self, sequence, result):
+		with self._lock:
+			if not self.ordered:
+				self._emit(result)
+				return
+			self._pending[sequence] = result
+			while self._next in self._pending:
+				self._emit(self._pending.pop(self._next))
+				self._next += 1
+
+	def _emit(self, result):
+		self.stream.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+		self.stream.flush()
+		if self.slots is not None:
+			self.slots.release()
+
+
+def serve(input_stream, output_stream, workers=DEFAULT_WORKERS, ordered=False):
+	"""
+	Process JSON-lines requests from input_stream until EOF.
+
+	Args:
+		input_stream: Text stream of requests
+		output_stream: Text stream for results
+		workers (int): Requests processed concurrently
+		ordered (bool): Deliver results in request order instead of completion order
+	"""
+	# A slot is taken per request line and given back once its result is written
+	slots = threading.BoundedSemaphore(workers * QUEUE_FACTOR)
+	writer = ResultWriter(output_stream, ordered, slots)
+
+	def run(sequence, request, received_at):
+		writer.write(sequence, handle_request(request, received_at))
+
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		sequence = 0
+		for line in input_stream:
+			if not line.strip():
+				continue
+			received_at = time.perf_counter()
+			slots.acquire()
+			try:
+				request = json.loads(line)
+				if not isinstance(request, dict):
+					raise ValueError("request must be a JSON object")
+			except ValueError as e:
+				writer.write(sequence, {"id": None, "op": None, "ok": False, "path": None,
+										"error": f"invalid request: {e}", "timings": None})
+				sequence += 1
+				continue
+
+			executor.submit(run, sequence, request, received_at)
+			sequence += 1
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Persistent JSON-lines MetaMingle worker (stdin -> stdout)")
+	parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+						help=f"Requests processed concurrently (default: {DEFAULT_WORKERS})")
+	parser.add_argument("--ordered", action="store_true", help="Deliver results in request order")
+	args = parser.parse_args()
+
+	# Keep stdout for results only; stray prints from the renderer go to stderr
+	results = sys.stdout
+	sys.stdout = sys.stderr
+	serve(sys.stdin, results, max(1, args.workers), args.ordered)
@@ -3,6 +3,7 @@ from PIL import Image
 from PIL.ExifTags import TAGS
 from fractions import Fraction
 from datetime import datetime
+from raw_api import is_raw_file, get_raw_exif
 
 def get_exif_info(image_path):
 	"""
@@ -29,11 +30,15 @@ def get_exif_info(image_path):
 	}
     
 	try:
-		image = Image.open(image_path)
+		if is_raw_file(image_path):
+			# RAW containers: read the EXIF IFDs straight from the file bytes
+			exif_data = get_raw_exif(image_path)
+		else:
+			image = Image.open(image_path)
+			exif_data = image._getexif() if hasattr(image, '_getexif') else None
 		
 		# Check if there is any EXIF data
-		if hasattr(image, '_getexif') and image._getexif() is not None:
-			exif_data = image._getexif()
+		if exif_data:
 			
 			# Convert numeric tags to human-readable tag names
 			exif = {TAGS.get(tag_id, tag_id): value for tag_id, value in exif_data.items()}
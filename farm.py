@@ -0,0 +1,367 @@
+"""
+Render farm: a job queue for add_exif_watermark kept in a SQLite database on
+shared storage.
+
+A coordinator enqueues jobs; any number of worker processes on any number of
+hosts lease them, heartbeat while rendering, and record the result or error.
+Leases that stop heartbeating (crashed or disconnected workers) expire and are
+handed out again, and enqueueing is idempotent, so an interrupted run resumes
+by simply starting the coordinator and workers again.
+
+The database uses SQLite's default rollback journal rather than WAL, since WAL
+does not work across hosts on network filesystems.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from batch import assign_output_paths, list_images
+from metamingle import add_exif_watermark, add_watermark_arguments, watermark_options
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 2.0
+# How long a connection waits for another host's write lock
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+	id INTEGER PRIMARY KEY,
+	image_path TEXT NOT NULL,
+	output_path TEXT NOT NULL,
+	options TEXT NOT NULL,
+	status TEXT NOT NULL DEFAULT 'queued',
+	attempts INTEGER NOT NULL DEFAULT 0,
+	worker TEXT,
+	lease_expires REAL,
+	started_at REAL,
+	finished_at REAL,
+	seconds REAL,
+	error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_image ON jobs (image_path);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_output ON jobs (output_path);
+"""
+
+
+def connect(db_path):
+	"""Open the queue database, creating the schema if needed."""
+	conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+	conn.row_factory = sqlite3.Row
+	conn.executescript(SCHEMA)
+	return conn
+
+
+class _transaction:
+	"""`BEGIN IMMEDIATE` block: takes the write lock up front so leasing is atomic across hosts."""
+
+	def __init__(self, conn):
+		self.conn = conn
+
+	def __enter__(self):
+		self.conn.execute("BEGIN IMMEDIATE")
+		return self.conn
+
+	def __exit__(self, exc_type, exc, tb):
+		self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def enqueue(db_path, image_paths, output_dir, options=None):
+	"""
+	Add render jobs to the queue. Paths already in the queue are skipped, so
+	re-running the coordinator resumes instead of duplicating work. Output names
+	are assigned with assign_output_paths against the outputs already queued,
+	so two images never render to the same file.
+
+	Args:
+		db_path (str): Path to the queue database on shared storage
+		image_paths (list): Images to render
+		output_dir (str): Folder for the rendered images
+		options (dict): Keyword arguments for add_exif_watermark
+
+	Returns:
+		int: Number of newly added jobs
+	"""
+	options = dict(options or {})
+	if options.get("logo_path"):
+		options["logo_path"] = os.path.abspath(options["logo_path"])
+	payload = json.dumps(options)
+	conn = connect(db_path)
+	try:
+		with _transaction(conn):
+			queued = {row["image_path"] for row in conn.execute("SELECT image_path FROM jobs")}
+			paths = []
+			for path in map(os.path.abspath, image_paths):
+				if path not in queued:
+					queued.add(path)
+					paths.append(path)
+
+			taken = [row["output_path"] for row in conn.execute("SELECT output_path FROM jobs")]
+			outputs = assign_output_paths(paths, os.path.abspath(output_dir), taken)
+			conn.executemany(
+				"INSERT INTO jobs (image_path, output_path, options) VALUES (?, ?, ?)",
+				[(path, output, payload) for path, output in zip(paths, outputs)])
+			return len(paths)
+	finally:
+		conn.close()
+
+
+def requeue_failed(db_path):
+	"""Put every failed job back in the queue with a fresh attempt count."""
+	conn = connect(db_path)
+	try:
+		with _transaction(conn):
+			return conn.execute(
+				"UPDATE jobs SET status = ?, attempts = 0, worker = NULL, error = NULL WHERE status = ?",
+				(QUEUED, FAILED)).rowcount
+	finally:
+		conn.close()
+
+
+def queue_status(db_path):
+	"""Return the number of jobs per status."""
+	conn = connect(db_path)
+	try:
+		rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+		counts = {status: 0 for status in (QUEUED, LEASED, DONE, FAILED)}
+		counts.update({row["status"]: row["n"] for row in rows})
+		return counts
+	finally:
+		conn.close()
+
+
+def _expire_leases(conn, now, max_attempts):
+	# Leases whose worker stopped heartbeating go back to the queue, unless
+	# they have used up their attempts (e.g. an image that crashes workers)
+	conn.execute(
+		"UPDATE jobs SET status = ?, worker = NULL, error = 'lease expired' "
+		"WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+		(FAILED, LEASED, now, max_attempts))
+	conn.execute(
+		"UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND lease_expires < ?",
+		(QUEUED, LEASED, now))
+
+
+def lease_job(conn, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+	"""
+	Atomically requeue expired leases and lease the oldest queued job.
+
+	Returns:
+		sqlite3.Row: The leased job, or None if the queue is empty
+	"""
+	now = time.time()
+	with _transaction(conn):
+		_expire_leases(conn, now, max_attempts)
+		job = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+		if job is None:
+			return None
+		conn.execute(
+			"UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, started_at = ?, attempts = attempts + 1 "
+			"WHERE id = ?",
+			(LEASED, worker_id, now + lease_seconds, now, job["id"]))
+		return job
+
+
+def heartbeat(conn, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+	"""Extend a lease. Returns False if the lease was lost to another worker."""
+	with _transaction(conn):
+		return conn.execute(
+			"UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+			(time.time() + lease_seconds, job_id, worker_id, LEASED)).rowcount == 1
+
+
+def finish_job(conn, job_id, worker_id, error=None, seconds=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+			   temp_path=None, output_path=None):
+	"""
+	Record the outcome of a leased job. Failed jobs are retried until they reach
+	max_attempts. Results from a worker that lost its lease are discarded.
+
+	A successful render written to temp_path is moved to output_path only once
+	the lease is confirmed, while the write lock is held, so a worker that lost
+	its lease never overwrites the output of the worker that took the job over.
+
+	Returns:
+		str: The job's new status (DONE, QUEUED for another attempt, or FAILED),
+		or None if this worker no longer owned the job and nothing was recorded
+	"""
+	with _transaction(conn):
+		if error is None:
+			status_sql, params = "?", (DONE,)
+		else:
+			status_sql, params = "CASE WHEN attempts >= ? THEN ? ELSE ? END", (max_attempts, FAILED, QUEUED)
+		owned = conn.execute(
+			f"UPDATE jobs SET status = {status_sql}, error = ?, seconds = ?, finished_at = ?, lease_expires = NULL "
+			"WHERE id = ? AND worker = ? AND status = ?",
+			params + (error, seconds, time.time(), job_id, worker_id, LEASED)).rowcount == 1
+		if not owned:
+			return None
+		if error is None and temp_path:
+			# Raising here rolls the update back, leaving the lease to expire and retry
+			os.replace(temp_path, output_path)
+		return conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()["status"]
+
+
+def _temp_output_path(output_path):
+	# Same folder (so os.replace stays atomic) and same extension (which picks the format)
+	folder, name = os.path.split(output_path)
+	stem, ext = os.path.splitext(name)
+	return os.path.join(folder, f".{stem}.{uuid.uuid4().hex}.tmp{ext}")
+
+
+def _render(job, output_path):
+	options = json.loads(job["options"])
+	if options.get("text_color") is not None:
+		options["text_color"] = tuple(options["text_color"])
+	os.makedirs(os.path.dirname(output_path), exist_ok=True)
+	add_exif_watermark(job["image_path"], output_path=output_path, **options)
+
+
+def _remove(path):
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
+
+
+def _heartbeat_loop(db_path, job_id, worker_id, lease_seconds, stop, lost):
+	conn = connect(db_path)
+	try:
+		while not stop.wait(lease_seconds / 3):
+			if not heartbeat(conn, job_id, worker_id, lease_seconds):
+				lost.set()
+				break
+	finally:
+		conn.close()
+
+
+def run_worker(db_path, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+			   max_attempts=DEFAULT_MAX_ATTEMPTS, poll_interval=DEFAULT_POLL_INTERVAL, exit_when_empty=False):
+	"""
+	Lease and render jobs until the queue is empty (with exit_when_empty) or forever.
+
+	Args:
+		db_path (str): Path to the queue database on shared storage
+		worker_id (str): Identifier recorded on leased jobs (default: host:pid)
+		lease_seconds (float): Lease duration; a background thread renews it every third of this
+		max_attempts (int): Attempts before a job is marked failed
+		poll_interval (float): Seconds to sleep when no job is available
+		exit_when_empty (bool): Return once no jobs are queued or leased
+
+	Returns:
+		int: Number of jobs this worker processed
+	"""
+	worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+	conn = connect(db_path)
+	processed = 0
+	try:
+		while True:
+			job = lease_job(conn, worker_id, lease_seconds, max_attempts)
+			if job is None:
+				if exit_when_empty:
+					# Keep polling while other workers hold leases that may still expire
+					leased = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (LEASED,)).fetchone()[0]
+					if leased == 0:
+						return processed
+				time.sleep(poll_interval)
+				continue
+
+			# Render to a private temp file; finish_job moves it into place
+			# only if this worker still holds the lease
+			stop, lost = threading.Event(), threading.Event()
+			beat = threading.Thread(target=_heartbeat_loop,
+									args=(db_path, job["id"], worker_id, lease_seconds, stop, lost), daemon=True)
+			beat.start()
+			temp_path = _temp_output_path(job["output_path"])
+			start = time.perf_counter()
+			error = None
+			try:
+				_render(job, temp_path)
+			except Exception as e:
+				error = str(e)
+			finally:
+				stop.set()
+				beat.join()
+
+			status = None
+			try:
+				if not lost.is_set():
+					status = finish_job(conn, job["id"], worker_id, error, time.perf_counter() - start,
+										max_attempts, temp_path, job["output_path"])
+			except OSError as e:
+				# Not recorded: the lease expires and the job is retried
+				error = f"could not move output into place: {e}"
+			_remove(temp_path)
+			if status is None:
+				print(f"[{worker_id}] discarded: {job['image_path']} ({error or 'lease lost'})")
+				continue
+			processed += 1
+			outcome = {DONE: "done", QUEUED: "will retry", FAILED: "failed"}[status]
+			print(f"[{worker_id}] {outcome}: {job['image_path']}" + (f" ({error})" if error else ""))
+	finally:
+		conn.close()
+
+
+def run_local_workers(db_path, processes, **kwargs):
+	"""Run several worker processes on this machine and wait for them to exit."""
+	workers = [multiprocessing.Process(target=run_worker, args=(db_path,), kwargs=kwargs)
+			   for _ in range(processes)]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Distributed MetaMingle rendering over a shared SQLite job queue")
+	commands = parser.add_subparsers(dest="command", required=True)
+
+	enqueue_parser = commands.add_parser("enqueue", help="Add images or folders to the queue")
+	enqueue_parser.add_argument("db", help="Queue database on shared storage")
+	enqueue_parser.add_argument("inputs", nargs="+", help="Images or folders of images")
+	enqueue_parser.add_argument("-o", "--output-dir", required=True, help="Output folder (on shared storage)")
+	add_watermark_arguments(enqueue_parser)
+
+	worker_parser = commands.add_parser("worker", help="Lease and render jobs")
+	worker_parser.add_argument("db", help="Queue database on shared storage")
+	worker_parser.add_argument("-n", "--processes", type=int, default=1, help="Worker processes on this host (default: 1)")
+	worker_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+							   help=f"Lease duration in seconds (default: {DEFAULT_LEASE_SECONDS})")
+	worker_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+							   help=f"Attempts before a job is marked failed (default: {DEFAULT_MAX_ATTEMPTS})")
+	worker_parser.add_argument("--exit-when-empty", action="store_true", help="Exit once the queue is drained")
+
+	status_parser = commands.add_parser("status", help="Show job counts")
+	status_parser.add_argument("db", help="Queue database on shared storage")
+
+	requeue_parser = commands.add_parser("requeue", help="Retry failed jobs")
+	requeue_parser.add_argument("db", help="Queue database on shared storage")
+
+	args = parser.parse_args()
+
+	if args.command == "enqueue":
+		paths = []
+		for path in args.inputs:
+			paths.extend(list_images(path) if os.path.isdir(path) else [path])
+		added = enqueue(args.db, paths, args.output_dir, watermark_options(args))
+		print(f"Enqueued {added} new jobs ({len(paths) - added} already queued)")
+	elif args.command == "worker":
+		kwargs = {"lease_seconds": args.lease, "max_attempts": args.max_attempts, "exit_when_empty": args.exit_when_empty}
+		if args.processes > 1:
+			run_local_workers(args.db, args.processes, **kwargs)
+		else:
+			run_worker(args.db, **kwargs)
+	elif args.command == "status":
+		print(json.dumps(queue_status(args.db), indent=2))
+	elif args.command == "requeue":
+		print(f"Requeued {requeue_failed(args.db)} failed jobs")
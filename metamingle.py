@@ -1,34 +1,80 @@
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 from exif_api import get_exif_info
+from raw_api import is_raw_file, open_image
+from palette_api import get_adaptive_palette
+from budget_api import save_within_budget
+from functools import lru_cache
+import argparse
 import os
+import threading
 
-def add_exif_watermark(image_path, output_path=None, logo_path=None, template_style="bottom_only",
-                        text_color=(0, 0, 0),
-                        border_ratio=35,     # border ratio (image dimension divided by this value)
-                        bottom_ratio=8,      # bottom border height ratio (image height divided by this value)
-                        font_ratio=5,        # font size ratio (bottom border height divided by this value)
-                        logo_ratio=3.5,      # logo size ratio (bottom border height divided by this value)
-                        padding_ratio=6):    # spacing ratio between logo and text (bottom border height divided by this value)
+# Resolved from this file, so the fonts load whatever the working directory is
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_REGULAR_PATH = os.path.join(BASE_DIR, "font", "Saira_Semi_Condensed", "SairaSemiCondensed-Regular.ttf")
+FONT_BOLD_PATH = os.path.join(BASE_DIR, "font", "Saira_Semi_Condensed", "SairaSemiCondensed-Bold.ttf")
+# Fonts loaded per size, kept per thread since FreeType faces are not thread-safe
+FONT_CACHE_SIZE = 32
+_font_cache = threading.local()
+# Renders run concurrently by the batch queue and the JSON-lines worker
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+def load_fonts(font_size):
 	"""
-	Add a watermark containing EXIF information and proportionally scaled borders to an image.
-	Automatically handles EXIF orientation and pads portrait images to 4:5 aspect ratio.
+	Return the (regular, bold) fonts at a size, loading each size once per thread.
+	Falls back to Pillow's default font if the bundled fonts are missing.
 	"""
+	cache = getattr(_font_cache, "fonts", None)
+	if cache is None or len(cache) >= FONT_CACHE_SIZE:
+		cache = _font_cache.fonts = {}
 
-	# Get EXIF information
-	exif_info = get_exif_info(image_path)
+	if font_size not in cache:
+		try:
+			font_regular = ImageFont.truetype(FONT_REGULAR_PATH, font_size)
+			font_bold = ImageFont.truetype(FONT_BOLD_PATH, font_size)
+		except:
+			font_regular = ImageFont.load_default()
+			font_bold = font_regular
+		cache[font_size] = (font_regular, font_bold)
+	return cache[font_size]
 
-	if output_path is None:
-		file_name, file_ext = os.path.splitext(image_path)
-		output_path = f"{file_name}_watermarked{file_ext}"
+@lru_cache(maxsize=64)
+def load_logo(logo_path, height):
+	"""
+	Return a logo as RGBA, resized to the given height. Results are cached, so
+	the returned image is shared and must not be modified.
+	"""
+	logo = Image.open(logo_path).convert("RGBA")
+	width = int(logo.width * (height / logo.height))
+	return logo.resize((width, height), Image.LANCZOS)
 
-	# Open original image
-	img = Image.open(image_path)
+def crop_box(width, height, ratio):
+	"""
+	Box of the largest centered region of a width x height image with the given width/height ratio.
+	"""
+	if (width / height) > ratio:
+		crop_width, crop_height = int(height * ratio), height
+	else:
+		crop_width, crop_height = width, int(width / ratio)
 
-	# [FIX] 自動根據 EXIF 資訊轉正照片 (解決直式照片變橫的問題)
-	img = ImageOps.exif_transpose(img)
+	left = (width - crop_width) // 2
+	top = (height - crop_height) // 2
+	return (left, top, left + crop_width, top + crop_height)
 
-	width, height = img.size
+def crop_to_ratio(img, ratio):
+	"""
+	Center-crop an image to a width/height ratio, keeping as much of it as possible.
+	"""
+	return img.crop(crop_box(img.width, img.height, ratio))
 
+def compute_layout(width, height, template_style="bottom_only", border_ratio=35, bottom_ratio=8):
+	"""
+	Compute the canvas geometry for an (already oriented and cropped) image of the given size.
+	Shared by add_exif_watermark and the dry-run planner, so plans match renders exactly.
+
+	Returns:
+		dict: border_width, bottom_height, final_width, final_height, offset_x, offset_y,
+		base_img_x, base_img_y and base_bottom_start_y
+	"""
 	# Calculate actual dimensions based on image size and ratio parameters
 	border_width = min(width, height) // border_ratio
 	bottom_height = int(height / bottom_ratio)
@@ -74,8 +120,68 @@ def add_exif_watermark(image_path, output_path=None, logo_path=None, template_st
 			# 計算上下需要補多少白邊才能置中
 			offset_y = (final_height - content_height) // 2
 
-	# Create new image with white background (Final 4:5 canvas)
-	new_img = Image.new('RGB', (final_width, final_height), (255, 255, 255))
+	return {
+		"border_width": border_width,
+		"bottom_height": bottom_height,
+		"final_width": final_width,
+		"final_height": final_height,
+		"offset_x": offset_x,
+		"offset_y": offset_y,
+		"base_img_x": base_img_x,
+		"base_img_y": base_img_y,
+		"base_bottom_start_y": base_bottom_start_y,
+	}
+
+def add_exif_watermark(image_path, output_path=None, logo_path=None, template_style="bottom_only",
+                        text_color=(0, 0, 0),
+                        border_ratio=35,     # border ratio (image dimension divided by this value)
+                        bottom_ratio=8,      # bottom border height ratio (image height divided by this value)
+                        font_ratio=5,        # font size ratio (bottom border height divided by this value)
+                        logo_ratio=3.5,      # logo size ratio (bottom border height divided by this value)
+                        padding_ratio=6,     # spacing ratio between logo and text (bottom border height divided by this value)
+                        adaptive_palette=False,  # pick border and text colors from the photo's dominant tones
+                        crop_ratio=None,     # center-crop the photo to this width/height ratio before adding borders
+                        max_bytes=None):     # maximum output file size; picks the highest JPEG/WebP quality that fits
+	"""
+	Add a watermark containing EXIF information and proportionally scaled borders to an image.
+	Automatically handles EXIF orientation and pads portrait images to 4:5 aspect ratio.
+	With adaptive_palette, the border and text colors are derived from the photo and text_color is ignored.
+	"""
+
+	# Get EXIF information
+	exif_info = get_exif_info(image_path)
+
+	if output_path is None:
+		file_name, file_ext = os.path.splitext(image_path)
+		if is_raw_file(image_path):
+			file_ext = ".jpg"
+		output_path = f"{file_name}_watermarked{file_ext}"
+
+	# Open original image (RAW files use their embedded JPEG preview)
+	img = open_image(image_path)
+
+	# [FIX] 自動根據 EXIF 資訊轉正照片 (解決直式照片變橫的問題)
+	img = ImageOps.exif_transpose(img)
+
+	if crop_ratio:
+		img = crop_to_ratio(img, crop_ratio)
+
+	# Border and text colors, sampled from the image as it will be rendered
+	border_color = (255, 255, 255)
+	if adaptive_palette:
+		border_color, text_color = get_adaptive_palette(img)
+
+	width, height = img.size
+
+	layout = compute_layout(width, height, template_style, border_ratio, bottom_ratio)
+	bottom_height = layout["bottom_height"]
+	final_width, final_height = layout["final_width"], layout["final_height"]
+	offset_x, offset_y = layout["offset_x"], layout["offset_y"]
+	base_img_x, base_img_y = layout["base_img_x"], layout["base_img_y"]
+	base_bottom_start_y = layout["base_bottom_start_y"]
+
+	# Create new image with border background (Final 4:5 canvas)
+	new_img = Image.new('RGB', (final_width, final_height), border_color)
 
 	# Paste original image (Content Position + Offset)
 	paste_x = base_img_x + offset_x
@@ -89,12 +195,7 @@ def add_exif_watermark(image_path, output_path=None, logo_path=None, template_st
 	font_size = int(bottom_height / font_ratio)
 
 	# Select font
-	try:
-		font_regular = ImageFont.truetype("./font/Saira_Semi_Condensed/SairaSemiCondensed-Regular.ttf", font_size)
-		font_bold = ImageFont.truetype("./font/Saira_Semi_Condensed/SairaSemiCondensed-Bold.ttf", font_size)
-	except:
-		font_regular = ImageFont.load_default()
-		font_bold = font_regular
+	font_regular, font_bold = load_fonts(font_size)
 
 	# Calculate padding
 	padding = bottom_height // padding_ratio
@@ -162,12 +263,9 @@ def add_exif_watermark(image_path, output_path=None, logo_path=None, template_st
 		logo_height = 0
 		if logo_path and os.path.exists(logo_path):
 			try:
-				logo = Image.open(logo_path).convert("RGBA")
 				logo_max_height = int(bottom_height/1.5)
-				logo_ratio_size = logo_max_height / logo.height
-				logo_new_width = int(logo.width * logo_ratio_size)
-				logo_new_height = logo_max_height
-				logo = logo.resize((logo_new_width, logo_new_height), Image.LANCZOS)
+				logo = load_logo(logo_path, logo_max_height)
+				logo_new_width, logo_new_height = logo.size
 				
 				camera_left_x = camera_x
 				min_separator_distance = padding * 2
@@ -209,12 +307,9 @@ def add_exif_watermark(image_path, output_path=None, logo_path=None, template_st
 		logo_height = 0
 		if logo_path and os.path.exists(logo_path):
 			try:
-				logo = Image.open(logo_path).convert("RGBA")
 				logo_max_height = int(bottom_height / logo_ratio)
-				logo_ratio_size = logo_max_height / logo.height
-				logo_new_width = int(logo.width * logo_ratio_size)
-				logo_new_height = logo_max_height
-				logo = logo.resize((logo_new_width, logo_new_height), Image.LANCZOS)
+				logo = load_logo(logo_path, logo_max_height)
+				logo_new_width, logo_new_height = logo.size
 				
 				# Center logo in the Final Width (Canvas)
 				logo_x = int((final_width - logo_new_width) // 2)
@@ -262,6 +357,71 @@ def add_exif_watermark(image_path, output_path=None, logo_path=None, template_st
 
 		draw.text(((final_width - text_width) / 2, text_y), line2, font=font_regular, fill=text_color)
 
-	new_img.save(output_path)
+	if max_bytes is not None:
+		save_within_budget(new_img, output_path, max_bytes)
+	else:
+		new_img.save(output_path)
 
 	return output_path
+
+def parse_color(value):
+	"""Parse an "R,G,B" string into an RGB tuple."""
+	try:
+		color = tuple(int(part) for part in value.split(','))
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"invalid color '{value}', expected R,G,B")
+	if len(color) != 3 or not all(0 <= c <= 255 for c in color):
+		raise argparse.ArgumentTypeError(f"invalid color '{value}', expected R,G,B")
+	return color
+
+def positive_int(value):
+	"""Parse a strictly positive integer."""
+	try:
+		number = int(value)
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"invalid value '{value}', expected a positive integer")
+	if number <= 0:
+		raise argparse.ArgumentTypeError(f"invalid value '{value}', expected a positive integer")
+	return number
+
+def add_watermark_arguments(parser):
+	"""Register the watermark style options shared by the command-line tools."""
+	parser.add_argument("-l", "--logo", help="Path to the camera logo image")
+	parser.add_argument("-t", "--template", default="bottom_only",
+						choices=["full_frame", "bottom_only", "classic"], help="Watermark template style")
+	parser.add_argument("-br", "--border-ratio", type=int, default=35, help="Border ratio (default: 35)")
+	parser.add_argument("-bh", "--bottom-ratio", type=float, default=8, help="Bottom border height ratio (default: 8)")
+	parser.add_argument("-fr", "--font-ratio", type=float, default=5, help="Font size ratio (default: 5)")
+	parser.add_argument("-lr", "--logo-ratio", type=float, default=3.5, help="Logo size ratio (default: 3.5)")
+	parser.add_argument("-pr", "--padding-ratio", type=int, default=6, help="Spacing ratio (default: 6)")
+	parser.add_argument("-c", "--color", type=parse_color, default=(0, 0, 0),
+						help="Text color in RGB format (default: \"0,0,0\")")
+	parser.add_argument("-a", "--adaptive-palette", action="store_true",
+						help="Pick border and text colors from the photo's dominant tones (overrides --color)")
+	parser.add_argument("-mb", "--max-bytes", type=positive_int,
+						help="Maximum output file size in bytes (JPEG/WebP only)")
+
+def watermark_options(args):
+	"""Map parsed watermark arguments to add_exif_watermark keyword arguments."""
+	return {
+		"logo_path": args.logo,
+		"template_style": args.template,
+		"text_color": args.color,
+		"border_ratio": args.border_ratio,
+		"bottom_ratio": args.bottom_ratio,
+		"font_ratio": args.font_ratio,
+		"logo_ratio": args.logo_ratio,
+		"padding_ratio": args.padding_ratio,
+		"adaptive_palette": args.adaptive_palette,
+		"max_bytes": args.max_bytes,
+	}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Add an EXIF watermark to a photo")
+	parser.add_argument("image_path", help="Path to the input image")
+	parser.add_argument("-o", "--output", help="Output file path")
+	add_watermark_arguments(parser)
+	args = parser.parse_args()
+
+	output = add_exif_watermark(args.image_path, output_path=args.output, **watermark_options(args))
+	print(f"Saved to {output}")
@@ -4,6 +4,9 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk, ImageOps
 import threading
 from metamingle import add_exif_watermark
+from raw_api import RAW_EXTENSIONS, open_image
+from batch import BatchRunner, list_images, DEFAULT_WORKERS, DONE, FAILED, CANCELLED
+import time
 import glob
 
 class PhotoWatermarkGUI:
@@ -11,6 +14,7 @@ class PhotoWatermarkGUI:
 		self.root = root
 		self.root.title("MetaMingle - IG Layout Editor")
 		self.root.geometry("1200x850")
+		self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
 		# Variables
 		self.image_path = None
@@ -39,6 +43,13 @@ class PhotoWatermarkGUI:
 		self.border_width = tk.IntVar(value=100)
 		self.font_size = tk.IntVar(value=120)
 
+		# Batch queue
+		self.batch_runner = None
+		self.batch_paths = []
+		self.batch_output_dir = tk.StringVar()
+		self.batch_workers = tk.IntVar(value=DEFAULT_WORKERS)
+		self.batch_crop = tk.BooleanVar(value=False)
+
 		# Build UI
 		self.create_ui()
 		# Initial placeholder display
@@ -51,8 +62,11 @@ class PhotoWatermarkGUI:
 		return glob.glob(os.path.join(logo_dir, "*.png"))
 
 	def create_ui(self):
-		main = ttk.Frame(self.root, padding=10)
-		main.pack(fill=tk.BOTH, expand=True)
+		notebook = ttk.Notebook(self.root)
+		notebook.pack(fill=tk.BOTH, expand=True)
+
+		main = ttk.Frame(notebook, padding=10)
+		notebook.add(main, text="Editor")
 
 		# Controls panel
 		ctrl = ttk.Frame(main, width=320, padding=10)
@@ -117,6 +131,57 @@ class PhotoWatermarkGUI:
 		self.canvas = tk.Canvas(canvas_frame, bg='#2b2b2b', highlightthickness=0)
 		self.canvas.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
+		batch = ttk.Frame(notebook, padding=10)
+		notebook.add(batch, text="Batch Queue")
+		self.create_batch_ui(batch)
+
+	def create_batch_ui(self, batch):
+		# Controls panel
+		ctrl = ttk.Frame(batch, width=320, padding=10)
+		ctrl.pack(side=tk.LEFT, fill=tk.Y)
+
+		ttk.Label(ctrl, text="1. Input", font=(None,14,'bold')).pack(anchor=tk.W, pady=(0,5))
+		ttk.Button(ctrl, text="Add Files", command=self.batch_add_files).pack(fill=tk.X, pady=2)
+		ttk.Button(ctrl, text="Add Folder", command=self.batch_add_folder).pack(fill=tk.X, pady=2)
+		ttk.Button(ctrl, text="Clear Queue", command=self.batch_clear).pack(fill=tk.X, pady=2)
+
+		ttk.Label(ctrl, text="2. Output", font=(None,14,'bold')).pack(anchor=tk.W, pady=(15,5))
+		ttk.Entry(ctrl, textvariable=self.batch_output_dir).pack(fill=tk.X, pady=2)
+		ttk.Button(ctrl, text="Choose Folder", command=self.batch_choose_output).pack(fill=tk.X, pady=2)
+
+		ttk.Label(ctrl, text="3. Options", font=(None,14,'bold')).pack(anchor=tk.W, pady=(15,5))
+		ttk.Label(ctrl, text="Template, logo and crop ratio follow the Editor tab.").pack(anchor=tk.W)
+		ttk.Checkbutton(ctrl, text="Center-crop to crop ratio", variable=self.batch_crop).pack(anchor=tk.W, pady=2)
+		workers = ttk.Frame(ctrl)
+		workers.pack(fill=tk.X, pady=2)
+		ttk.Label(workers, text="Workers").pack(side=tk.LEFT)
+		ttk.Spinbox(workers, from_=1, to=32, width=5, textvariable=self.batch_workers).pack(side=tk.RIGHT)
+
+		ttk.Label(ctrl, text="4. Actions", font=(None,14,'bold')).pack(anchor=tk.W, pady=(15,5))
+		ttk.Button(ctrl, text="Start", command=self.batch_start).pack(fill=tk.X, pady=2)
+		ttk.Button(ctrl, text="Cancel", command=self.batch_cancel).pack(fill=tk.X, pady=2)
+		ttk.Button(ctrl, text="Retry Failed", command=self.batch_retry_failed).pack(fill=tk.X, pady=2)
+
+		self.batch_status_label = ttk.Label(ctrl, text="Queue empty", foreground='green')
+		self.batch_status_label.pack(anchor=tk.W, pady=(15,0))
+
+		# Queue panel
+		queue_panel = ttk.Frame(batch)
+		queue_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+
+		self.batch_progress = ttk.Progressbar(queue_panel, mode='determinate')
+		self.batch_progress.pack(fill=tk.X, pady=(0,10))
+
+		columns = ('file', 'status', 'time', 'detail')
+		self.batch_tree = ttk.Treeview(queue_panel, columns=columns, show='headings')
+		for column, title, width in zip(columns, ('File', 'Status', 'Time', 'Detail'), (260, 90, 70, 400)):
+			self.batch_tree.heading(column, text=title)
+			self.batch_tree.column(column, width=width, anchor=tk.W)
+		scroll = ttk.Scrollbar(queue_panel, orient=tk.VERTICAL, command=self.batch_tree.yview)
+		self.batch_tree.configure(yscrollcommand=scroll.set)
+		scroll.pack(side=tk.RIGHT, fill=tk.Y)
+		self.batch_tree.pack(fill=tk.BOTH, expand=True)
+
 	def update_crop_text(self):
 		ratio = self.crop_ratio_val.get()
 		if ratio == 1.5:
@@ -132,7 +197,7 @@ class PhotoWatermarkGUI:
 		if self.crop_win and self.crop_win.winfo_exists():
 			self.crop_win.destroy()
 			
-		img = Image.open(self.image_path)
+		img = open_image(self.image_path)
 		self.original_img = ImageOps.exif_transpose(img) 
 		
 		width, height = self.original_img.size
@@ -286,8 +351,17 @@ class PhotoWatermarkGUI:
 				return path
 		return None
 
+	def get_template_style(self):
+		if self.preview_mode == "full":
+			return "full_frame"
+		elif self.preview_mode == "classic":
+			return "classic"
+		return "bottom_only"
+
 	def select_image(self):
-		fp = filedialog.askopenfilename(filetypes=[('Image files','*.jpg *.jpeg *.png')])
+		raw_patterns = ' '.join(f'*{ext}' for ext in RAW_EXTENSIONS)
+		fp = filedialog.askopenfilename(filetypes=[('Image files', f'*.jpg *.jpeg *.png {raw_patterns}'),
+												('RAW files', raw_patterns)])
 		if not fp: return
 		self.image_path = fp
 		self.update_status(f'Loaded: {os.path.basename(fp)}')
@@ -304,12 +378,7 @@ class PhotoWatermarkGUI:
 		tmp = "preview_temp.jpg"
 		logo = self.get_selected_logo_path()
 		
-		if self.preview_mode == "full":
-			template = "full_frame"
-		elif self.preview_mode == "classic":
-			template = "classic"
-		else:
-			template = "bottom_only"
+		template = self.get_template_style()
 		
 		try:
 			add_exif_watermark(
@@ -357,12 +426,7 @@ class PhotoWatermarkGUI:
 		
 		logo = self.get_selected_logo_path()
 		
-		if self.preview_mode == "full":
-			template = "full_frame"
-		elif self.preview_mode == "classic":
-			template = "classic"
-		else:
-			template = "bottom_only"
+		template = self.get_template_style()
 		
 		try:
 			add_exif_watermark(
@@ -375,6 +439,147 @@ class PhotoWatermarkGUI:
 		except Exception as e:
 			messagebox.showerror("Error", str(e))
 
+	# --- Batch queue ---
+
+	def batch_add_files(self):
+		raw_patterns = ' '.join(f'*{ext}' for ext in RAW_EXTENSIONS)
+		paths = filedialog.askopenfilenames(filetypes=[('Image files', f'*.jpg *.jpeg *.png {raw_patterns}')])
+		self._batch_add(paths)
+
+	def batch_add_folder(self):
+		folder = filedialog.askdirectory()
+		if not folder: return
+		self._batch_add(list_images(folder))
+		if not self.batch_output_dir.get():
+			self.batch_output_dir.set(os.path.join(folder, 'watermarked'))
+
+	def _batch_add(self, paths):
+		if not paths: return
+		if self.batch_runner and self.batch_runner.running:
+			messagebox.showinfo('Info', 'Wait for the current batch to finish')
+			return
+		# The same file twice would render twice into the same output; skip it
+		queued = {os.path.abspath(path) for path in self.batch_paths}
+		new_paths = []
+		for path in paths:
+			if os.path.abspath(path) not in queued:
+				queued.add(os.path.abspath(path))
+				new_paths.append(path)
+		skipped = len(paths) - len(new_paths)
+
+		# Keep the runner, so finished items are not rendered again on the next start
+		if self.batch_runner:
+			self.batch_runner.add(new_paths)
+		for path in new_paths:
+			self.batch_paths.append(path)
+			self.batch_tree.insert('', tk.END, iid=str(len(self.batch_paths) - 1),
+								   values=(os.path.basename(path), 'Queued', '', ''))
+		msg = f'{len(self.batch_paths)} images queued'
+		if skipped:
+			msg += f' ({skipped} already in queue)'
+		self.update_batch_status(msg)
+
+	def batch_clear(self):
+		if self.batch_runner and self.batch_runner.running: return
+		self.batch_runner = None
+		self.batch_paths = []
+		self.batch_tree.delete(*self.batch_tree.get_children())
+		self.batch_progress['value'] = 0
+		self.update_batch_status('Queue empty')
+
+	def batch_choose_output(self):
+		folder = filedialog.askdirectory()
+		if folder:
+			self.batch_output_dir.set(folder)
+
+	def batch_start(self):
+		if not self.batch_paths:
+			messagebox.showinfo('Info', 'Add images to the queue first')
+			return
+		if self.batch_runner and self.batch_runner.running: return
+
+		output_dir = self.batch_output_dir.get()
+		if not output_dir:
+			messagebox.showinfo('Info', 'Choose an output folder first')
+			return
+
+		# Snapshot the current editor settings for this run
+		options = {
+			'logo_path': self.get_selected_logo_path(),
+			'template_style': self.get_template_style(),
+			'crop_ratio': self.crop_ratio_val.get() if self.batch_crop.get() else None,
+		}
+		try:
+			workers = max(1, self.batch_workers.get())
+		except tk.TclError:
+			workers = DEFAULT_WORKERS
+		runner = self.batch_runner
+		if runner is None or runner.output_dir != output_dir:
+			# A new output folder starts over; otherwise only unfinished items run
+			runner = self.batch_runner = BatchRunner(output_dir, options, max_workers=workers)
+			runner.add(self.batch_paths)
+		else:
+			runner.options = options
+			runner.max_workers = workers
+		if all(item['status'] == DONE for item in runner.items):
+			messagebox.showinfo('Info', 'Every image in the queue is already done')
+			return
+		runner.start()
+		self._refresh_batch_rows(range(len(self.batch_paths)))
+		self.root.after(100, self._poll_batch)
+
+	def batch_cancel(self):
+		if not self.batch_runner: return
+		self.batch_runner.cancel()
+		self._refresh_batch_rows(range(len(self.batch_paths)))
+
+	def batch_retry_failed(self):
+		if not self.batch_runner: return
+		was_active = self.batch_runner.active
+		failed = [i for i, item in enumerate(self.batch_runner.items) if item['status'] == FAILED]
+		self.batch_runner.retry_failed()
+		self._refresh_batch_rows(failed)
+		if failed and not was_active:
+			self.root.after(100, self._poll_batch)
+
+	def _poll_batch(self):
+		# Runs on the Tk main loop; workers only post events to the runner
+		runner = self.batch_runner
+		if runner is None: return
+		self._refresh_batch_rows(runner.poll())
+
+		stats = runner.stats()
+		counts = stats['counts']
+		finished = counts[DONE] + counts[FAILED] + counts[CANCELLED]
+		self.batch_progress['maximum'] = max(stats['total'], 1)
+		self.batch_progress['value'] = finished
+
+		msg = f"{counts[DONE]}/{stats['total']} done, {counts[FAILED]} failed"
+		if stats['throughput'] > 0:
+			msg += f" | {stats['throughput']:.2f} img/s"
+		if runner.active:
+			if stats['eta'] is not None:
+				msg += f" | ETA {time.strftime('%H:%M:%S', time.gmtime(stats['eta']))}"
+			self.update_batch_status(msg, 'orange')
+			self.root.after(100, self._poll_batch)
+		else:
+			self.update_batch_status(msg, 'red' if counts[FAILED] else 'green')
+
+	def _refresh_batch_rows(self, indices):
+		for index in indices:
+			item = self.batch_runner.items[index]
+			seconds = f"{item['seconds']:.2f}s" if item['seconds'] else ''
+			self.batch_tree.item(str(index), values=(os.path.basename(item['path']), item['status'], seconds, item['detail']))
+
+	def update_batch_status(self, msg, color="green"):
+		self.batch_status_label.config(text=msg, foreground=color)
+
+	def on_close(self):
+		# Stop the batch pool too, or its threads keep rendering after the window is gone
+		if self.batch_runner:
+			self.batch_runner.cancel()
+		self.root.destroy()
+
 if __name__ == '__main__':
 	root = tk.Tk()
 	app = PhotoWatermarkGUI(root)
@@ -0,0 +1,102 @@
+from PIL import Image
+
+# Statistics are computed on a point-sampled grid of at most SAMPLE_GRID
+# pixels on the long side, averaged down to SAMPLE_SIZE; the full-resolution
+# pixels are never scanned
+SAMPLE_GRID = 384
+SAMPLE_SIZE = 96
+# Number of dominant tones to extract, and k-means refinement passes
+PALETTE_COLORS = 6
+KMEANS_ITERATIONS = 2
+# WCAG contrast ratio required for body text
+MIN_CONTRAST = 4.5
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+
+
+def _relative_luminance(color):
+	"""WCAG relative luminance of an sRGB color."""
+	channels = []
+	for value in color:
+		c = value / 255
+		channels.append(c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4)
+	r, g, b = channels
+	return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def contrast_ratio(color_a, color_b):
+	"""
+	WCAG contrast ratio between two RGB colors.
+
+	Args:
+		color_a (tuple): RGB color
+		color_b (tuple): RGB color
+
+	Returns:
+		float: Ratio between 1 (identical) and 21 (black on white)
+	"""
+	lighter, darker = sorted((_relative_luminance(color_a), _relative_luminance(color_b)), reverse=True)
+	return (lighter + 0.05) / (darker + 0.05)
+
+
+def _sample(img):
+	"""
+	Downsample an image for color statistics. A point-sampled grid is taken
+	first, so the cost depends on SAMPLE_GRID rather than the megapixels of
+	the image, then averaged down to SAMPLE_SIZE.
+	"""
+	scale = SAMPLE_GRID / max(img.size)
+	if scale < 1:
+		grid = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+		img = img.resize(grid, Image.NEAREST)
+	img = img.convert('RGB')
+	img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+	return img
+
+
+def get_dominant_colors(img, colors=PALETTE_COLORS):
+	"""
+	Extract the dominant tones of an image from a small sample of its pixels.
+	Clustering runs in Pillow's C median-cut/k-means quantizer.
+
+	Args:
+		img (PIL.Image.Image): The image as it will be rendered (oriented and cropped)
+		colors (int): Number of tones to extract
+
+	Returns:
+		list: (pixel_count, (r, g, b)) tuples, most frequent first
+	"""
+	quantized = _sample(img).quantize(colors=colors, kmeans=KMEANS_ITERATIONS, dither=Image.NONE)
+	palette = quantized.getpalette()
+
+	dominant = [(count, tuple(palette[3 * index:3 * index + 3]))
+				for count, index in quantized.getcolors(colors)]
+	dominant.sort(reverse=True)
+	return dominant
+
+
+def get_adaptive_palette(img):
+	"""
+	Pick a border color and a contrasting text color from the photo's dominant tones.
+
+	The border takes the most frequent tone. The text takes the most frequent
+	remaining tone that reaches the WCAG contrast ratio against the border,
+	falling back to black or white when no tone of the photo is legible.
+
+	Args:
+		img (PIL.Image.Image): The image as it will be rendered (oriented and cropped)
+
+	Returns:
+		tuple: (border_color, text_color) as RGB tuples
+	"""
+	dominant = get_dominant_colors(img)
+	border_color = dominant[0][1]
+
+	for _, color in dominant[1:]:
+		if contrast_ratio(color, border_color) >= MIN_CONTRAST:
+			return border_color, color
+
+	if contrast_ratio(BLACK, border_color) >= contrast_ratio(WHITE, border_color):
+		return border_color, BLACK
+	return border_color, WHITE
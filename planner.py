@@ -0,0 +1,238 @@
+"""
+Dry-run planner: output geometry, megapixels, memory and time estimates for
+a batch, computed from image headers only. No pixel data is decoded, so tens
+of thousands of files can be planned in seconds.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from PIL import Image
+from batch import list_images
+from metamingle import add_exif_watermark, add_watermark_arguments, watermark_options, compute_layout, crop_box
+from raw_api import is_raw_file, get_raw_exif, get_raw_preview_size
+
+TAG_ORIENTATION = 274
+# EXIF orientations that rotate the image by 90 or 270 degrees
+SWAPPED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Bytes per pixel of Pillow's in-memory storage (RGB is stored padded to 4 bytes)
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "LA": 4, "RGB": 4, "RGBA": 4, "CMYK": 4, "YCbCr": 4, "I": 4, "F": 4}
+
+# Fallback calibration profile, overridden by `planner.py calibrate`
+DEFAULT_PROFILE = {
+	"overhead_seconds": 0.05,          # fonts, logo, EXIF parsing
+	"seconds_per_megapixel": 0.02,     # per input + output megapixel
+	"memory_overhead_bytes": 32 << 20, # fonts, logo and interpreter working set
+}
+
+
+def load_profile(profile_path=None):
+	"""Load a calibration profile, falling back to DEFAULT_PROFILE for missing values."""
+	profile = dict(DEFAULT_PROFILE)
+	if profile_path:
+		with open(profile_path) as fp:
+			profile.update(json.load(fp))
+	return profile
+
+
+def _header_info(image_path):
+	"""Return (width, height, mode, orientation) without decoding pixels."""
+	if is_raw_file(image_path):
+		width, height = get_raw_preview_size(image_path)
+		orientation = get_raw_exif(image_path).get(TAG_ORIENTATION, 1)
+		return width, height, "RGB", orientation
+
+	with Image.open(image_path) as img:
+		orientation = 1
+		if hasattr(img, 'tag_v2'):
+			# TIFF: tags are parsed on open
+			orientation = img.tag_v2.get(TAG_ORIENTATION, 1)
+		elif img.info.get('exif'):
+			# JPEG/WebP, and PNG with eXIf before the image data. getexif() is
+			# avoided since PNG would decode the image to look past IDAT
+			exif = Image.Exif()
+			exif.load(img.info['exif'])
+			orientation = exif.get(TAG_ORIENTATION, 1)
+		return img.width, img.height, img.mode, orientation
+
+
+def plan_image(image_path, template_style="bottom_only", border_ratio=35, bottom_ratio=8,
+			   crop_ratio=None, profile=None):
+	"""
+	Plan the render of one image from its header.
+
+	Args:
+		image_path (str): Path to the image file
+		template_style (str): Watermark template style
+		border_ratio (int): Border ratio, as for add_exif_watermark
+		bottom_ratio (float): Bottom border height ratio, as for add_exif_watermark
+		crop_ratio (float): Optional center-crop width/height ratio
+		profile (dict): Calibration profile (default: DEFAULT_PROFILE)
+
+	Returns:
+		dict: Source and oriented size, final canvas and layout, megapixels and
+		estimated memory (bytes) and time (seconds); or the path and an error
+	"""
+	profile = profile or DEFAULT_PROFILE
+	try:
+		source_width, source_height, mode, orientation = _header_info(image_path)
+	except Exception as e:
+		return {"path": image_path, "error": str(e)}
+
+	width, height = source_width, source_height
+	if orientation in SWAPPED_ORIENTATIONS:
+		width, height = height, width
+	if crop_ratio:
+		left, top, right, bottom = crop_box(width, height, crop_ratio)
+		width, height = right - left, bottom - top
+
+	layout = compute_layout(width, height, template_style, border_ratio, bottom_ratio)
+	source_pixels = source_width * source_height
+	output_pixels = layout["final_width"] * layout["final_height"]
+
+	# Peak memory: decoded source, a transposed and a cropped copy when those
+	# steps apply, and the output canvas
+	bytes_per_pixel = MODE_BYTES.get(mode, 4)
+	memory = source_pixels * bytes_per_pixel
+	if orientation not in (None, 1):
+		memory += source_pixels * bytes_per_pixel
+	if crop_ratio:
+		memory += width * height * bytes_per_pixel
+	memory += output_pixels * MODE_BYTES["RGB"]
+	memory += profile["memory_overhead_bytes"]
+
+	megapixels = (source_pixels + output_pixels) / 1e6
+	seconds = profile["overhead_seconds"] + profile["seconds_per_megapixel"] * megapixels
+
+	return {
+		"path": image_path,
+		"source_size": [source_width, source_height],
+		"orientation": orientation,
+		"image_size": [width, height],
+		"output_size": [layout["final_width"], layout["final_height"]],
+		"layout": layout,
+		"source_megapixels": source_pixels / 1e6,
+		"output_megapixels": output_pixels / 1e6,
+		"estimated_memory": memory,
+		"estimated_seconds": seconds,
+	}
+
+
+def summarize(plans, workers=1):
+	"""
+	Aggregate per-image plans for capacity planning.
+
+	Args:
+		plans (list): Results of plan_image
+		workers (int): Number of concurrent render workers to plan for
+
+	Returns:
+		dict: Image and error counts, total megapixels, total CPU seconds,
+		estimated wall time and peak memory with the given number of workers
+	"""
+	ok = [plan for plan in plans if "error" not in plan]
+	memories = sorted((plan["estimated_memory"] for plan in ok), reverse=True)
+	cpu_seconds = sum(plan["estimated_seconds"] for plan in ok)
+	return {
+		"images": len(ok),
+		"errors": len(plans) - len(ok),
+		"source_megapixels": sum(plan["source_megapixels"] for plan in ok),
+		"output_megapixels": sum(plan["output_megapixels"] for plan in ok),
+		"cpu_seconds": cpu_seconds,
+		"workers": workers,
+		"wall_seconds": cpu_seconds / workers,
+		"peak_memory": sum(memories[:workers]),
+	}
+
+
+def calibrate(sample_paths, **options):
+	"""
+	Build a calibration profile by rendering sample images and fitting
+	seconds = overhead + rate * (input + output megapixels) by least squares.
+
+	Args:
+		sample_paths (list): Representative images (a handful of sizes works best)
+		**options: Keyword arguments for add_exif_watermark
+
+	Returns:
+		dict: Calibration profile
+	"""
+	profile = dict(DEFAULT_PROFILE)
+	samples = []
+	with tempfile.TemporaryDirectory() as tmp:
+		for index, path in enumerate(sample_paths):
+			plan = plan_image(path, options.get("template_style", "bottom_only"),
+							  options.get("border_ratio", 35), options.get("bottom_ratio", 8),
+							  options.get("crop_ratio"))
+			if "error" in plan:
+				continue
+			start = time.perf_counter()
+			add_exif_watermark(path, output_path=os.path.join(tmp, f"{index}.jpg"), **options)
+			samples.append((plan["source_megapixels"] + plan["output_megapixels"], time.perf_counter() - start))
+
+	if not samples:
+		return profile
+
+	mean_x = sum(x for x, _ in samples) / len(samples)
+	mean_y = sum(y for _, y in samples) / len(samples)
+	variance = sum((x - mean_x) ** 2 for x, _ in samples)
+	if variance > 0:
+		rate = sum((x - mean_x) * (y - mean_y) for x, y in samples) / variance
+		overhead = mean_y - rate * mean_x
+	else:
+		overhead = profile["overhead_seconds"]
+		rate = (mean_y - overhead) / mean_x
+
+	profile["seconds_per_megapixel"] = max(rate, 0.0)
+	profile["overhead_seconds"] = max(overhead, 0.0)
+	return profile
+
+
+def _expand(inputs):
+	paths = []
+	for path in inputs:
+		paths.extend(list_images(path) if os.path.isdir(path) else [path])
+	return paths
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Plan MetaMingle renders without decoding pixels")
+	commands = parser.add_subparsers(dest="command", required=True)
+
+	plan_parser = commands.add_parser("plan", help="Plan the render of images or folders")
+	plan_parser.add_argument("inputs", nargs="+", help="Images or folders of images")
+	plan_parser.add_argument("--crop-ratio", type=float, help="Center-crop width/height ratio")
+	plan_parser.add_argument("-p", "--profile", help="Calibration profile (JSON)")
+	plan_parser.add_argument("-w", "--workers", type=int, default=1, help="Concurrent workers to plan for (default: 1)")
+	plan_parser.add_argument("--details", action="store_true", help="Print one JSON line per image")
+	add_watermark_arguments(plan_parser)
+
+	calibrate_parser = commands.add_parser("calibrate", help="Time sample renders and write a profile")
+	calibrate_parser.add_argument("inputs", nargs="+", help="Sample images or folders")
+	calibrate_parser.add_argument("-p", "--profile", required=True, help="Output profile path (JSON)")
+	calibrate_parser.add_argument("--crop-ratio", type=float, help="Center-crop width/height ratio")
+	add_watermark_arguments(calibrate_parser)
+
+	args = parser.parse_args()
+	paths = _expand(args.inputs)
+
+	if args.command == "plan":
+		profile = load_profile(args.profile)
+		start = time.perf_counter()
+		plans = [plan_image(path, args.template, args.border_ratio, args.bottom_ratio, args.crop_ratio, profile)
+				 for path in paths]
+		if args.details:
+			for plan in plans:
+				print(json.dumps(plan))
+		summary = summarize(plans, max(1, args.workers))
+		summary["planning_seconds"] = time.perf_counter() - start
+		print(json.dumps(summary, indent=2))
+	elif args.command == "calibrate":
+		options = watermark_options(args)
+		options["crop_ratio"] = args.crop_ratio
+		profile = calibrate(paths, **options)
+		with open(args.profile, 'w') as fp:
+			json.dump(profile, fp, indent=2)
+		print(json.dumps(profile, indent=2))
@@ -0,0 +1,273 @@
+import io
+import os
+import struct
+from PIL import Image, TiffImagePlugin
+from PIL.ExifTags import TAGS
+
+# RAW containers we can read without demosaicing. All of them except RAF are
+# plain TIFF files; RAF has its own header pointing at an embedded JPEG.
+RAW_EXTENSIONS = ('.nef', '.nrw', '.arw', '.srf', '.sr2', '.dng', '.cr2', '.pef', '.raf')
+
+RAF_MAGIC = b"FUJIFILMCCD-RAW "
+
+# TIFF tags used to locate previews inside the container
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_STRIP_OFFSETS = 273
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_SUB_IFDS = 330
+TAG_JPEG_OFFSET = 513
+TAG_JPEG_LENGTH = 514
+TAG_EXIF_IFD = 34665
+
+# Compression values for JPEG-compressed strips, and photometric values of
+# sensor data (CFA / LinearRaw) which is never a displayable preview
+JPEG_COMPRESSIONS = (6, 7)
+RAW_PHOTOMETRICS = (32803, 34892)
+
+# Only baseline, extended and progressive JPEGs can be decoded by Pillow;
+# lossless (SOF3) streams hold raw sensor data in CR2/DNG files
+DECODABLE_SOF_MARKERS = (0xC0, 0xC1, 0xC2)
+SOF_MARKERS = (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+
+# Tags copied onto the preview so it carries the container's metadata
+TAG_IDS = {name: tag_id for tag_id, name in TAGS.items()}
+PREVIEW_IFD0_TAGS = ('Make', 'Model', 'Orientation', 'DateTime', 'Artist', 'Copyright')
+PREVIEW_EXIF_TAGS = ('ExposureTime', 'FNumber', 'ISOSpeedRatings', 'DateTimeOriginal',
+					'DateTimeDigitized', 'ExposureBiasValue', 'FocalLength',
+					'FocalLengthIn35mmFilm', 'LensSpecification', 'LensMake', 'LensModel')
+
+
+def is_raw_file(image_path):
+	"""
+	Check whether a path points to a supported RAW container, based on its extension.
+
+	Args:
+		image_path (str): Path to the image file
+
+	Returns:
+		bool: True if the file should be read through the RAW fast path
+	"""
+	return os.path.splitext(image_path)[1].lower() in RAW_EXTENSIONS
+
+
+def _as_tuple(value):
+	if isinstance(value, (tuple, list)):
+		return tuple(value)
+	return (value,)
+
+
+def _read_ifd(fp, header, offset):
+	ifd = TiffImagePlugin.ImageFileDirectory_v2(header)
+	fp.seek(offset)
+	ifd.load(fp)
+	return ifd
+
+
+def _walk_ifds(fp, header, offset, seen):
+	"""Yield every IFD in the main chain and in nested SubIFDs."""
+	while offset and offset not in seen:
+		seen.add(offset)
+		ifd = _read_ifd(fp, header, offset)
+		yield ifd
+		for sub_offset in _as_tuple(ifd.get(TAG_SUB_IFDS, ())):
+			yield from _walk_ifds(fp, header, sub_offset, seen)
+		offset = ifd.next
+
+
+def _jpeg_frame(fp, offset, length):
+	"""
+	Walk the JPEG marker segments at `offset` up to the first SOF marker,
+	without reading the entropy-coded data.
+
+	Returns:
+		tuple: (sof_marker, width, height), or None if this is not a JPEG stream
+	"""
+	end = offset + length
+	fp.seek(offset)
+	if fp.read(2) != b"\xff\xd8":
+		return None
+	pos = offset + 2
+	while pos + 4 <= end:
+		fp.seek(pos)
+		segment = fp.read(4)
+		if len(segment) < 4 or segment[0] != 0xFF:
+			return None
+		marker = segment[1]
+		if marker == 0xFF:
+			pos += 1
+			continue
+		if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+			pos += 2
+			continue
+		segment_length = struct.unpack(">H", segment[2:4])[0]
+		if marker in SOF_MARKERS:
+			frame = fp.read(5)
+			if len(frame) < 5:
+				return None
+			_, height, width = struct.unpack(">BHH", frame)
+			return marker, width, height
+		pos += 2 + segment_length
+	return None
+
+
+def _preview_candidates(ifd):
+	"""Return the (offset, length) pairs of JPEG streams referenced by an IFD."""
+	candidates = []
+
+	if TAG_JPEG_OFFSET in ifd and TAG_JPEG_LENGTH in ifd:
+		candidates.append((ifd[TAG_JPEG_OFFSET], ifd[TAG_JPEG_LENGTH]))
+
+	if ifd.get(TAG_COMPRESSION) in JPEG_COMPRESSIONS and ifd.get(TAG_PHOTOMETRIC) not in RAW_PHOTOMETRICS:
+		offsets = _as_tuple(ifd.get(TAG_STRIP_OFFSETS, ()))
+		counts = _as_tuple(ifd.get(TAG_STRIP_BYTE_COUNTS, ()))
+		if len(offsets) == 1 and len(counts) == 1:
+			candidates.append((offsets[0], counts[0]))
+
+	return candidates
+
+
+def _find_tiff_preview(fp):
+	header = fp.read(8)
+	first_ifd = TiffImagePlugin.ImageFileDirectory_v2(header).next
+
+	best = None
+	best_area = 0
+	for ifd in _walk_ifds(fp, header, first_ifd, set()):
+		for offset, length in _preview_candidates(ifd):
+			if not length:
+				continue
+			frame = _jpeg_frame(fp, offset, length)
+			if frame is None or frame[0] not in DECODABLE_SOF_MARKERS:
+				continue
+			area = frame[1] * frame[2]
+			if area > best_area:
+				best, best_area = (offset, length), area
+	return best
+
+
+def _find_raf_preview(fp):
+	fp.seek(84)
+	return struct.unpack(">II", fp.read(8))
+
+
+def _locate_preview(fp, image_path):
+	"""Return (offset, length, is_raf) of the largest embedded JPEG."""
+	is_raf = fp.read(16) == RAF_MAGIC
+	if is_raf:
+		location = _find_raf_preview(fp)
+	else:
+		fp.seek(0)
+		location = _find_tiff_preview(fp)
+
+	if location is None:
+		raise ValueError(f"No embedded JPEG preview found in {os.path.basename(image_path)}")
+	return location[0], location[1], is_raf
+
+
+def _read_preview_bytes(image_path):
+	"""Return the bytes of the largest embedded JPEG and whether the file is a RAF."""
+	with open(image_path, 'rb') as fp:
+		offset, length, is_raf = _locate_preview(fp, image_path)
+		fp.seek(offset)
+		return fp.read(length), is_raf
+
+
+def get_raw_preview_size(image_path):
+	"""
+	Size of the preview that open_raw_preview returns, read from the JPEG
+	headers only (before EXIF orientation is applied).
+
+	Args:
+		image_path (str): Path to the RAW file
+
+	Returns:
+		tuple: (width, height)
+	"""
+	with open(image_path, 'rb') as fp:
+		offset, length, _ = _locate_preview(fp, image_path)
+		frame = _jpeg_frame(fp, offset, length)
+
+	if frame is None:
+		raise ValueError(f"Invalid embedded JPEG preview in {os.path.basename(image_path)}")
+	return frame[1], frame[2]
+
+
+def get_raw_exif(image_path):
+	"""
+	Read EXIF tags straight from a RAW container, without touching image data.
+
+	Args:
+		image_path (str): Path to the RAW file
+
+	Returns:
+		dict: Numeric tag IDs mapped to values, with IFD0 and the EXIF IFD merged,
+		in the same shape as Pillow's `_getexif()`
+	"""
+	with open(image_path, 'rb') as fp:
+		if fp.read(16) == RAF_MAGIC:
+			# RAF keeps its metadata inside the embedded JPEG
+			offset, length = _find_raf_preview(fp)
+			fp.seek(offset)
+			preview = Image.open(io.BytesIO(fp.read(length)))
+			return preview._getexif() or {}
+
+		fp.seek(0)
+		header = fp.read(8)
+		ifd0 = _read_ifd(fp, header, TiffImagePlugin.ImageFileDirectory_v2(header).next)
+		exif = dict(ifd0)
+		if TAG_EXIF_IFD in ifd0:
+			exif.update(_read_ifd(fp, header, ifd0[TAG_EXIF_IFD]))
+		return exif
+
+
+def _exif_bytes(exif_data):
+	exif = Image.Exif()
+	for name in PREVIEW_IFD0_TAGS:
+		if TAG_IDS[name] in exif_data:
+			exif[TAG_IDS[name]] = exif_data[TAG_IDS[name]]
+
+	exif_ifd = {TAG_IDS[name]: exif_data[TAG_IDS[name]]
+				for name in PREVIEW_EXIF_TAGS if TAG_IDS[name] in exif_data}
+	if exif_ifd:
+		exif[TAG_EXIF_IFD] = exif_ifd
+	return exif.tobytes()
+
+
+def open_raw_preview(image_path):
+	"""
+	Open the largest embedded JPEG preview of a RAW file as a Pillow image.
+	No demosaicing takes place: the preview is sliced out of the container bytes.
+
+	For TIFF-based containers the container's EXIF (including orientation) is
+	attached to the preview, so `ImageOps.exif_transpose` and `_getexif()` behave
+	as they would for a camera JPEG.
+
+	Args:
+		image_path (str): Path to the RAW file
+
+	Returns:
+		PIL.Image.Image: The preview image (lazily decoded)
+	"""
+	data, is_raf = _read_preview_bytes(image_path)
+	preview = Image.open(io.BytesIO(data))
+
+	if not is_raf:
+		preview.info['exif'] = _exif_bytes(get_raw_exif(image_path))
+
+	return preview
+
+
+def open_image(image_path):
+	"""
+	Open an image, going through the embedded preview for RAW files.
+
+	Args:
+		image_path (str): Path to the image file
+
+	Returns:
+		PIL.Image.Image: The opened image
+	"""
+	if is_raw_file(image_path):
+		return open_raw_preview(image_path)
+	return Image.open(image_path)
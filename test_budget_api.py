@@ -0,0 +1,64 @@
+"""
+save_within_budget must pick the same quality as a brute-force sweep over
+every quality, for budgets across the whole size range.
+"""
+import os
+import random
+import pytest
+from PIL import Image
+from budget_api import save_within_budget, _encode, MIN_QUALITY, MAX_QUALITY, MAX_FULL_ENCODES
+import budget_api
+
+WIDTH, HEIGHT = 400, 300
+# Proxy of a tenth of the pixels, as rough as it is on multi-megapixel photos
+PROXY_PIXELS = 20_000
+BUDGETS = 25
+
+
+def _test_image():
+	"""Deterministic image with both smooth areas and fine detail."""
+	rng = random.Random(0)
+	coarse = Image.frombytes("RGB", (WIDTH // 10, HEIGHT // 10), rng.randbytes(WIDTH // 10 * HEIGHT // 10 * 3))
+	coarse = coarse.resize((WIDTH, HEIGHT), Image.BICUBIC)
+	fine = Image.frombytes("L", (WIDTH, HEIGHT), rng.randbytes(WIDTH * HEIGHT)).convert("RGB")
+	gradient = Image.linear_gradient("L").resize((WIDTH, HEIGHT)).convert("RGB")
+	return Image.blend(Image.blend(coarse, fine, 0.25), gradient, 0.4)
+
+
+@pytest.fixture(scope="module")
+def image():
+	return _test_image()
+
+
+@pytest.mark.parametrize("image_format, extension", [("JPEG", ".jpg"), ("WEBP", ".webp")])
+def test_matches_brute_force(image, image_format, extension, tmp_path, monkeypatch):
+	monkeypatch.setattr(budget_api, "PROXY_PIXELS", PROXY_PIXELS)
+	sizes = {quality: len(_encode(image, image_format, quality)) for quality in range(MIN_QUALITY, MAX_QUALITY + 1)}
+
+	full_encodes = []
+	def counting_encode(img, fmt, quality):
+		if img.size == image.size:
+			full_encodes.append(quality)
+		return _encode(img, fmt, quality)
+	monkeypatch.setattr(budget_api, "_encode", counting_encode)
+
+	smallest, largest = sizes[MIN_QUALITY], sizes[MAX_QUALITY]
+	for step in range(BUDGETS):
+		max_bytes = int(smallest + (largest - smallest) * (step / (BUDGETS - 1)) ** 2)
+		expected = max(quality for quality, size in sizes.items() if size <= max_bytes)
+		output_path = os.path.join(tmp_path, f"{step}{extension}")
+
+		full_encodes.clear()
+		assert save_within_budget(image, output_path, max_bytes) == expected, f"budget {max_bytes}"
+		assert os.path.getsize(output_path) <= max_bytes
+		assert len(full_encodes) <= MAX_FULL_ENCODES
+
+
+def test_too_small_budget(image, tmp_path):
+	with pytest.raises(ValueError):
+		save_within_budget(image, os.path.join(tmp_path, "out.jpg"), 1000)
+
+
+def test_rejects_non_positive_budget(image, tmp_path):
+	with pytest.raises(ValueError):
+		save_within_budget(image, os.path.join(tmp_path, "out.jpg"), 0)